@@ -1,9 +1,11 @@
 import collections
 import contextlib
+import functools
 from datetime import datetime, timedelta
 import socket
 import os
 import shutil
+import signal
 import subprocess
 import sys
 import tempfile
@@ -16,11 +18,52 @@ from labrad import crypto
 from cryptography import x509
 from cryptography.x509.oid import NameOID
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import ec
 
 
+# These tests start their own labrad managers, which is slow, so they only
+# run when selected with `-m slow`. Skip them if the manager is not installed
+# rather than failing each one.
+pytestmark = [
+    pytest.mark.slow,
+    pytest.mark.skipif(shutil.which('labrad') is None,
+                       reason='labrad manager binary not on PATH'),
+]
 
 
+@functools.lru_cache(maxsize=None)
+def _localhost_cert():
+    """Generate a self-signed certificate and key for localhost.
+
+    We do this once and cache the result for all tests in this module.
+
+    Returns (bytes, bytes):
+        A tuple of the PEM-encoded certificate and private key, respectively.
+    """
+    # generate a localhost certificate with SAN so hostname verification passes.
+    # We use an ECDSA P-256 key since it is much cheaper to generate than RSA.
+    key = ec.generate_private_key(ec.SECP256R1())
+    now = datetime.utcnow()
+    subject = issuer = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(issuer)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    cert_pem = cert.public_bytes(serialization.Encoding.PEM)
+    key_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    return cert_pem, key_pem
+
 
 @contextlib.contextmanager
 def temp_tls_dirs():
@@ -34,38 +77,18 @@ def temp_tls_dirs():
     Yields (string, string):
         A tuple of paths for the TLS certs and keys, respectively.
     """
-    user_dir = os.path.expanduser('~')
-    cert_path = tempfile.mkdtemp(prefix='.labrad-test-certs', dir=user_dir)
-    key_path = tempfile.mkdtemp(prefix='.labrad-test-keys', dir=user_dir)
+    cert_path = tempfile.mkdtemp(prefix='labrad-test-certs-')
+    key_path = tempfile.mkdtemp(prefix='labrad-test-keys-')
     old_cert_path = crypto.CERTS_PATH
     crypto.CERTS_PATH = cert_path
     try:
-        # generate a localhost certificate with SAN so hostname verification passes
-        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
-        subject = issuer = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
-        cert = (
-            x509.CertificateBuilder()
-            .subject_name(subject)
-            .issuer_name(issuer)
-            .public_key(key.public_key())
-            .serial_number(x509.random_serial_number())
-            .not_valid_before(datetime.utcnow() - timedelta(days=1))
-            .not_valid_after(datetime.utcnow() + timedelta(days=1))
-            .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False)
-            .sign(key, hashes.SHA256())
-        )
+        cert_pem, key_pem = _localhost_cert()
         cert_file = os.path.join(cert_path, "localhost.cert")
         key_file = os.path.join(key_path, "localhost.key")
         with open(cert_file, "wb") as cf:
-            cf.write(cert.public_bytes(serialization.Encoding.PEM))
+            cf.write(cert_pem)
         with open(key_file, "wb") as kf:
-            kf.write(
-                key.private_bytes(
-                    serialization.Encoding.PEM,
-                    serialization.PrivateFormat.TraditionalOpenSSL,
-                    serialization.NoEncryption(),
-                )
-            )
+            kf.write(key_pem)
         yield cert_path, key_path
     finally:
         crypto.CERTS_PATH = old_cert_path
@@ -77,24 +100,48 @@ def temp_tls_dirs():
 ManagerInfo = collections.namedtuple('ManagerInfo', ['port', 'tls_port', 'password'])
 
 
-def _free_port():
-    s = socket.socket()
-    s.bind(('', 0))
-    p = s.getsockname()[1]
-    s.close()
-    return p
+def _free_ports(n=2):
+    """Find n distinct free ports.
+
+    All sockets are bound before any is closed, so the ports are distinct.
+    SO_REUSEADDR is harmless belt-and-braces here; sockets that are only
+    bound, never listened on or connected, leave no TIME_WAIT state behind.
+    """
+    socks = [socket.socket() for _ in range(n)]
+    try:
+        for s in socks:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind(('', 0))
+        return [s.getsockname()[1] for s in socks]
+    finally:
+        for s in socks:
+            s.close()
+
+
+def _kill_process_group(proc, sig):
+    try:
+        os.killpg(proc.pid, sig)
+    except ProcessLookupError:
+        pass  # all processes in the group have already exited
+
 
 @contextlib.contextmanager
-def run_manager(tls_required, port=None, tls_port=None, startup_timeout=20):
+def run_manager(tls_required, cert_path, key_path, port=None, tls_port=None,
+                startup_timeout=20):
     """Context manager to run the labrad manager in a subprocess.
 
-    Will attempt to connect to the manager and fail if we cannot do so within
-    the specified timeout. This ensures that the manager is actually running
+    Waits for the manager to accept connections on the TLS port and then
+    logs in once, failing if the manager exits or does not start within the
+    specified timeout. This ensures that the manager is actually running
     and listening for connections before we yield to execute the body of the
     with statement.
 
     Args:
         tls_required (boolean): Whether the manager should require TLS.
+        cert_path (string): Directory containing the localhost TLS cert, as
+            created by temp_tls_dirs.
+        key_path (string): Directory containing the localhost TLS key, as
+            created by temp_tls_dirs.
         port (int): The port on which to listen for upgradeable connections
             that start unencrypted and then use STARTTLS to secure the
             connection.
@@ -106,98 +153,142 @@ def run_manager(tls_required, port=None, tls_port=None, startup_timeout=20):
     Yields (ManagerInfo):
         Info about the running manager.
     """
+    free_port, free_tls_port = _free_ports(2)
     if port is None:
-        port = _free_port()
+        port = free_port
     if tls_port is None:
-        tls_port = _free_port()
-    with temp_tls_dirs() as (cert_path, key_path):
-        password = 'DummyPassword'
-        cert_file = os.path.join(cert_path, 'localhost.cert')
-        key_file = os.path.join(key_path, 'localhost.key')
-        manager = subprocess.Popen([
-                'labrad',
-                '--password={}'.format(password),
-                '--port={}'.format(port),
-                '--tls-port={}'.format(tls_port),
-                '--tls-required={}'.format(tls_required),
-                '--tls-required-localhost={}'.format(tls_required),
-                '--tls-cert-path={}'.format(cert_path),
-                '--tls-key-path={}'.format(key_path),
-                '--tls-hosts=localhost?cert={}&key={}'.format(cert_file, key_file)])
-        try:
-            start = time.time()
-            while True:
-                try:
-                    labrad.connect(port=tls_port, tls_mode='on',
-                                   password=password)
-                except Exception as e:
-                    last_error = e
-                else:
-                    break
-                elapsed = time.time() - start
-                if elapsed > startup_timeout:
-                    raise Exception('labrad failed to start within {} seconds. '
-                                    'last_error={}'
-                                    .format(startup_timeout, last_error))
-                time.sleep(0.5)
-            yield ManagerInfo(port, tls_port, password)
-        finally:
-            manager.terminate()
+        tls_port = free_tls_port
+    password = 'DummyPassword'
+    cert_file = os.path.join(cert_path, 'localhost.cert')
+    key_file = os.path.join(key_path, 'localhost.key')
+    manager = subprocess.Popen([
+            'labrad',
+            '--password={}'.format(password),
+            '--port={}'.format(port),
+            '--tls-port={}'.format(tls_port),
+            '--tls-required={}'.format(tls_required),
+            '--tls-required-localhost={}'.format(tls_required),
+            '--tls-cert-path={}'.format(cert_path),
+            '--tls-key-path={}'.format(key_path),
+            '--tls-hosts=localhost?cert={}&key={}'.format(cert_file, key_file)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        close_fds=True, start_new_session=True)
+    try:
+        start = time.time()
+        while True:
+            if manager.poll() is not None:
+                raise Exception('labrad exited with code {} during startup'
+                                .format(manager.returncode))
             try:
-                manager.wait(timeout=5)
-            except Exception:
-                manager.kill()
+                socket.create_connection(('localhost', tls_port),
+                                         timeout=0.1).close()
+            except OSError as e:
+                last_error = e
+            else:
+                break
+            elapsed = time.time() - start
+            if elapsed > startup_timeout:
+                raise Exception('labrad failed to start within {} seconds. '
+                                'last_error={}'
+                                .format(startup_timeout, last_error))
+            time.sleep(0.02)
+        # The manager is accepting connections, so make sure we can log in.
+        with labrad.connect(port=tls_port, tls_mode='on',
+                            password=password):
+            pass
+        yield ManagerInfo(port, tls_port, password)
+    finally:
+        # The manager runs in its own session, so signal the whole process
+        # group to also stop the JVM launched by the labrad script.
+        _kill_process_group(manager, signal.SIGTERM)
+        try:
+            manager.wait(timeout=5)
+        except Exception:
+            _kill_process_group(manager, signal.SIGKILL)
+
+
+# Managers shared by all tests in this module. Tests using the same manager
+# are put in the same xdist group so that when running in parallel with
+# `--dist loadgroup` each manager is only started once. Both managers use
+# the same TLS dirs, so labrad.crypto.CERTS_PATH is only overridden once.
+
+@pytest.fixture(scope='module')
+def tls_dirs():
+    with temp_tls_dirs() as (cert_path, key_path):
+        yield cert_path, key_path
+
+
+@pytest.fixture(scope='module')
+def tls_required_manager(tls_dirs):
+    cert_path, key_path = tls_dirs
+    with run_manager(tls_required=True, cert_path=cert_path,
+                     key_path=key_path) as m:
+        yield m
+
+
+@pytest.fixture(scope='module')
+def tls_optional_manager(tls_dirs):
+    cert_path, key_path = tls_dirs
+    with run_manager(tls_required=False, cert_path=cert_path,
+                     key_path=key_path) as m:
+        yield m
 
 
 # Test that we can establish encrypted TLS connections to the manager
 
-def test_connect_with_starttls():
-    with run_manager(tls_required=True) as m:
-        with labrad.connect(port=m.port, tls_mode='starttls-force',
-                            password=m.password) as cxn:
-            pass
+@pytest.mark.xdist_group('tls_required')
+def test_connect_with_starttls(tls_required_manager):
+    m = tls_required_manager
+    with labrad.connect(port=m.port, tls_mode='starttls-force',
+                        password=m.password) as cxn:
+        pass
 
 
-def test_connect_with_optional_starttls():
-    with run_manager(tls_required=False) as m:
-        with labrad.connect(port=m.port, tls_mode='off',
-                            password=m.password) as cxn:
-            pass
+@pytest.mark.xdist_group('tls_optional')
+def test_connect_with_optional_starttls(tls_optional_manager):
+    m = tls_optional_manager
+    with labrad.connect(port=m.port, tls_mode='off',
+                        password=m.password) as cxn:
+        pass
 
 
-def test_connect_with_tls():
-    with run_manager(tls_required=True) as m:
-        with labrad.connect(port=m.tls_port, tls_mode='on',
-                            password=m.password) as cxn:
-            pass
+@pytest.mark.xdist_group('tls_required')
+def test_connect_with_tls(tls_required_manager):
+    m = tls_required_manager
+    with labrad.connect(port=m.tls_port, tls_mode='on',
+                        password=m.password) as cxn:
+        pass
 
 
 # Test that connecting to the manager fails if the client fails to
 # use TLS when the manager expects it.
 
-def test_expect_starttls_use_off():
-    with run_manager(tls_required=True) as m:
-        with pytest.raises(Exception):
-            with labrad.connect(port=m.port, tls_mode='off',
-                                password=m.password) as cxn:
-                pass
+@pytest.mark.xdist_group('tls_required')
+def test_expect_starttls_use_off(tls_required_manager):
+    m = tls_required_manager
+    with pytest.raises(Exception):
+        with labrad.connect(port=m.port, tls_mode='off',
+                            password=m.password) as cxn:
+            pass
 
 
-def test_expect_tls_use_off():
-    with run_manager(tls_required=True) as m:
-        with pytest.raises(Exception):
-            with labrad.connect(port=m.tls_port, tls_mode='off',
-                                password=m.password) as cxn:
-                pass
+@pytest.mark.xdist_group('tls_required')
+def test_expect_tls_use_off(tls_required_manager):
+    m = tls_required_manager
+    with pytest.raises(Exception):
+        with labrad.connect(port=m.tls_port, tls_mode='off',
+                            password=m.password) as cxn:
+            pass
 
 
-def test_expect_tls_use_starttls():
-    with run_manager(tls_required=True) as m:
-        with pytest.raises(Exception):
-            with labrad.connect(port=m.tls_port, tls_mode='off',
-                                password=m.password) as cxn:
-                pass
+@pytest.mark.xdist_group('tls_required')
+def test_expect_tls_use_starttls(tls_required_manager):
+    m = tls_required_manager
+    with pytest.raises(Exception):
+        with labrad.connect(port=m.tls_port, tls_mode='off',
+                            password=m.password) as cxn:
+            pass
 
 
 if __name__ == '__main__':
-    pytest.main(['-v', __file__])
+    pytest.main(['-v', '-m', 'slow', __file__])
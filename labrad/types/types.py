@@ -124,11 +124,30 @@ class Buffer(object):
 
 # typetag parsing
 
+# a cache of parsed types, keyed by type tag string
+_typeTagCache = {} # type tag -> type object
+_TYPE_TAG_CACHE_SIZE = 1024
+
 def parseTypeTag(s):
-    """Parse a type tag into a LabRAD type object."""
+    """Parse a type tag into a LabRAD type object.
+
+    Fully-specified types are cached and shared between calls. Other types,
+    such as 'v' or '*?', get specialized in place when used for flattening,
+    so we parse a fresh copy of those every time.
+    """
+    if isinstance(s, Type):
+        return s
+    t = _typeTagCache.get(s)
+    if t is None:
+        t = _parseTypeTag(s)
+        if (t.isFullySpecified() and
+                len(_typeTagCache) < _TYPE_TAG_CACHE_SIZE):
+            _typeTagCache[s] = t
+    return t
+
+def _parseTypeTag(s):
+    """Parse a type tag string into a LabRAD type object, without caching."""
     try:
-        if isinstance(s, Type):
-            return s
         s = stripComments(s)
         ## this is a workaround for a bug in the manager
         ## What bug? This needs to be explained.
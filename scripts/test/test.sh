@@ -29,6 +29,9 @@ if ! python -c "import twisted" 2>/dev/null; then
   python3 -m pip install --break-system-packages --ignore-installed -r requirements.txt
   python3 -m pip install --break-system-packages pytest
 fi
+if ! python3 -c "import xdist" 2>/dev/null; then
+  python3 -m pip install --break-system-packages pytest-xdist
+fi
 python3 -m pip install --break-system-packages --no-deps .
 
 # start labrad manager
@@ -37,10 +40,13 @@ LABRAD_PID=$!
 trap 'kill $LABRAD_PID 2>/dev/null' EXIT
 sleep 20
 
-# run the tests
+# run the tests (slow tests are deselected by default, see setup.cfg)
 pytest -v .
 STATUS=$?
 
+# the slow TLS tests start their own managers, which we run in parallel
+pytest -v -m slow -n 2 --dist loadgroup labrad/test/test_tls.py || STATUS=$?
+
 echo "=== .labrad.log ===" && cat .labrad.log && echo
 
 exit $STATUS